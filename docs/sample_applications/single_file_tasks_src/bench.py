@@ -0,0 +1,325 @@
+"""Benchmark the tasks app in-process, without a web server.
+
+Seeds a fresh database with open tasks, then runs a mix of requests against
+the list, new and close views from several threads, and reports requests per
+second, latency percentiles and the memory allocated per request as JSON::
+
+    $ python bench.py --tasks 10000 --concurrency 8 --requests 5000 \\
+          --mix list=80,new=10,close=10 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from webob import Request
+
+import tasks
+
+
+# drivers
+class WSGIDriver(object):
+    """Call the WSGI application directly, one environ per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, params=None):
+        request = Request.blank(path, method=method, POST=params)
+        status, headers, app_iter = request.call_application(self.app)
+        try:
+            for chunk in app_iter:
+                pass
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        return int(status.split(' ', 1)[0])
+
+
+class WebTestDriver(object):
+    """Go through WebTest, which also keeps each thread's session cookie."""
+
+    def __init__(self, app):
+        from webtest import TestApp
+        self.local = threading.local()
+        self.app = app
+        self.TestApp = TestApp
+
+    def request(self, method, path, params=None):
+        testapp = getattr(self.local, 'testapp', None)
+        if testapp is None:
+            testapp = self.local.testapp = self.TestApp(self.app)
+        if method == 'POST':
+            response = testapp.post(path, params, expect_errors=True)
+        else:
+            response = testapp.get(path, expect_errors=True)
+        return response.status_int
+
+
+DRIVERS = {'wsgi': WSGIDriver, 'webtest': WebTestDriver}
+
+
+# scenarios
+def list_op(driver, rnd, seeded):
+    return driver.request('GET', '/')
+
+
+def page_op(driver, rnd, seeded):
+    return driver.request('GET', '/?after=%d' % rnd.randrange(seeded))
+
+
+def new_op(driver, rnd, seeded):
+    name = 'bench task %d' % rnd.randrange(1000000)
+    return driver.request('POST', '/new', {'name': name})
+
+
+def close_op(driver, rnd, seeded):
+    return driver.request('GET', '/close/%d' % rnd.randrange(seeded))
+
+
+OPERATIONS = {'list': list_op, 'page': page_op, 'new': new_op,
+              'close': close_op}
+
+
+def parse_mix(value):
+    mix = []
+    for part in value.split(','):
+        name, weight = part.split('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError('unknown operation %r' % name)
+        mix.append((name, int(weight)))
+    return mix
+
+
+# measurements
+def percentile(values, percent):
+    # nearest rank, on sorted values
+    if not values:
+        return None
+    rank = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    ms = lambda seconds: None if seconds is None else seconds * 1000
+    return {
+        'count': len(latencies),
+        'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50': ms(percentile(latencies, 50)),
+        'p95': ms(percentile(latencies, 95)),
+        'p99': ms(percentile(latencies, 99)),
+        'max': ms(latencies[-1]) if latencies else None,
+    }
+
+
+def make_app(db, concurrency):
+    settings = {
+        'db': db,
+        'db.pool_size': concurrency,
+        'db.commit_delay': 0.002,
+        'tasks.page_size': 100,
+        'mako.directories': os.path.join(tasks.here, 'templates'),
+    }
+    return tasks.make_config(settings).make_wsgi_app()
+
+
+def seed(db, count):
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute('delete from tasks')
+        conn.executemany(
+            'insert into tasks (id, name, closed) values (?, ?, 0)',
+            ((i, 'Seeded task %d' % i) for i in range(count)))
+    conn.close()
+
+
+def run(driver, mix, requests, concurrency, seeded, seed_value):
+    names = [name for name, weight in mix]
+    weights = [weight for name, weight in mix]
+    latencies = dict((name, []) for name in names)
+    errors = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker(number):
+        rnd = random.Random(seed_value + number)
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            name = rnd.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = OPERATIONS[name](driver, rnd, seeded)
+            except Exception as e:
+                status = repr(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if not isinstance(status, int) or status >= 400:
+                    errors.append((name, status))
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    return latencies, errors, duration
+
+
+def measure_allocations(driver, mix, requests, seeded, seed_value):
+    # A separate, single threaded pass: tracing slows everything down.
+    # For each request, the peak of traced memory above what was in use
+    # before it is the memory the request allocated, less what it freed
+    # and reused along the way.  ``retained`` is what stayed allocated.
+    names = [name for name, weight in mix]
+    weights = [weight for name, weight in mix]
+    rnd = random.Random(seed_value)
+    peaks = []
+    retained = 0
+    tracemalloc.start()
+    try:
+        for i in range(requests):
+            name = rnd.choices(names, weights)[0]
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            OPERATIONS[name](driver, rnd, seeded)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained += current - before
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        'requests': requests,
+        'peak_bytes_per_request': sum(peaks) / float(requests),
+        'peak_bytes_p95': percentile(peaks, 95),
+        'peak_bytes_max': peaks[-1],
+        'retained_bytes_per_request': retained / float(requests),
+    }
+
+
+def compare(results, previous):
+    lines = []
+    for key, label in [('requests_per_second', 'requests/s'),
+                       ('p50', 'p50 ms'), ('p95', 'p95 ms'),
+                       ('p99', 'p99 ms')]:
+        if key == 'requests_per_second':
+            old, new = previous[key], results[key]
+        else:
+            old, new = previous['latency'][key], results['latency'][key]
+        change = (new - old) / old * 100 if old else 0
+        lines.append('%-12s %10.2f -> %10.2f (%+.1f%%)'
+                     % (label, old, new, change))
+    return '\n'.join(lines)
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tasks', type=int, default=10000,
+                        help='open tasks to seed (default: 10000)')
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='requests to make (default: 5000)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='threads making requests (default: 8)')
+    parser.add_argument('--mix', type=parse_mix,
+                        default=parse_mix('list=70,page=10,new=10,close=10'),
+                        help='weighted operations among %s (default: '
+                             'list=70,page=10,new=10,close=10)'
+                             % ', '.join(sorted(OPERATIONS)))
+    parser.add_argument('--driver', choices=sorted(DRIVERS), default='wsgi',
+                        help='how to call the application (default: wsgi)')
+    parser.add_argument('--allocation-requests', type=int, default=200,
+                        help='requests in the allocation pass, 0 to skip '
+                             '(default: 200)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the random request mix (default: 0)')
+    parser.add_argument('--db', help='a new database file, kept afterwards '
+                                     '(default: a temporary file, removed '
+                                     'afterwards)')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to '
+                                          'compare with')
+    options = parser.parse_args(argv)
+    if options.db is not None and os.path.exists(options.db):
+        # seeding deletes every task in it
+        parser.error('%s exists, give a new file to --db' % options.db)
+
+    tmpdir = None
+    db = options.db
+    if db is None:
+        tmpdir = tempfile.mkdtemp()
+        db = os.path.join(tmpdir, 'bench.db')
+    try:
+        app = make_app(db, options.concurrency)
+        seed(db, options.tasks)
+        driver = DRIVERS[options.driver](app)
+        # warm up the connection pool, templates and caches
+        run(driver, options.mix, options.concurrency * 10,
+            options.concurrency, options.tasks, options.seed)
+        latencies, errors, duration = run(
+            driver, options.mix, options.requests, options.concurrency,
+            options.tasks, options.seed)
+        allocations = None
+        if options.allocation_requests:
+            allocations = measure_allocations(
+                driver, options.mix, options.allocation_requests,
+                options.tasks, options.seed)
+        pool_stats = app.registry.db_pool.stats()
+        app.registry.db_writer.close()
+        app.registry.db_pool.close()
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    everything = [value for values in latencies.values() for value in values]
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'options': {
+            'tasks': options.tasks,
+            'requests': options.requests,
+            'concurrency': options.concurrency,
+            'mix': dict(options.mix),
+            'driver': options.driver,
+            'seed': options.seed,
+        },
+        'duration': duration,
+        'requests_per_second': options.requests / duration,
+        'errors': len(errors),
+        'latency': summarize(everything),
+        'operations': dict((name, summarize(values))
+                           for name, values in latencies.items()),
+        'allocations': allocations,
+        'pool': pool_stats,
+    }
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if options.compare:
+        with open(options.compare) as f:
+            print(compare(results, json.load(f)))
+    if errors:
+        sys.stderr.write('%d requests failed, first: %r\n'
+                         % (len(errors), errors[0]))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
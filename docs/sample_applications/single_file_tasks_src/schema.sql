@@ -4,7 +4,32 @@ create table if not exists tasks (
     closed bool not null
 );
 
+create index if not exists tasks_open on tasks (id) where closed = 0;
+
+create virtual table if not exists tasks_search using fts5 (
+    name, content='tasks', content_rowid='id'
+);
+
+create trigger if not exists tasks_search_insert
+after insert on tasks begin
+    insert into tasks_search (rowid, name) values (new.id, new.name);
+end;
+
+create trigger if not exists tasks_search_delete
+after delete on tasks begin
+    insert into tasks_search (tasks_search, rowid, name)
+        values ('delete', old.id, old.name);
+end;
+
+create trigger if not exists tasks_search_update
+after update of name on tasks begin
+    insert into tasks_search (tasks_search, rowid, name)
+        values ('delete', old.id, old.name);
+    insert into tasks_search (rowid, name) values (new.id, new.name);
+end;
+
 insert or ignore into tasks (id, name, closed) values (0, 'Start learning Pyramid', 0);
 insert or ignore into tasks (id, name, closed) values (1, 'Do quick tutorial', 0);
 insert or ignore into tasks (id, name, closed) values (2, 'Have some beer!', 0);
 
+insert into tasks_search (tasks_search) values ('rebuild');
@@ -1,16 +1,37 @@
+import argparse
+import csv
+import io
+import itertools
+import json
 import os
 import logging
+import queue
+import selectors
+import signal
+import socket
 import sqlite3
+import threading
+import time
+import zlib
+
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from pyramid.config import Configurator
 from pyramid.events import ApplicationCreated
-from pyramid.events import NewRequest
 from pyramid.events import subscriber
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import HTTPUnsupportedMediaType
+from pyramid.renderers import render
+from pyramid.response import Response
 from pyramid.session import UnencryptedCookieSessionFactoryConfig
 from pyramid.view import view_config
 
-from wsgiref.simple_server import make_server
+from wsgiref.simple_server import ServerHandler
+from wsgiref.simple_server import WSGIRequestHandler
+from wsgiref.simple_server import WSGIServer
 
 
 logging.basicConfig()
@@ -18,23 +39,524 @@ log = logging.getLogger(__file__)
 
 here = os.path.dirname(os.path.abspath(__file__))
 
+# stands in for the list of tasks when all_view splits up list.mako
+TASKS_MARKER = '<!-- tasks -->'
+
+# tasks per executemany or fetchmany call when importing or exporting tasks
+BULK_CHUNK_SIZE = 1000
+
+
+# database
+class DatabaseBusy(sqlite3.OperationalError):
+    """Raised when the database is too busy to serve a request in time."""
+
+
+class ConnectionPool(object):
+    """A bounded pool of SQLite connections shared by all threads.
+
+    Connections are opened on demand, up to ``size`` of them, and each one
+    runs the ``pragmas`` statements once when it is opened.  Released
+    connections are handed out again, together with their cache of prepared
+    statements, instead of being closed.
+    """
+
+    def __init__(self, path, size=5, timeout=10.0, pragmas=(),
+                 cached_statements=100):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False,
+                             cached_statements=self.cached_statements)
+        for pragma in self.pragmas:
+            db.execute(pragma)
+        return db
+
+    def acquire(self):
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            with self._lock:
+                self._hits += 1
+            return db
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+                self._misses += 1
+        if can_open:
+            try:
+                return self.connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        # every connection is in use: wait for one to be released
+        start = time.monotonic()
+        try:
+            db = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise DatabaseBusy('connection pool exhausted')
+        with self._lock:
+            self._waits += 1
+            self._wait_time += time.monotonic() - start
+        return db
+
+    def release(self, db):
+        # never hand out a connection with a transaction left open
+        db.rollback()
+        self._idle.put(db)
+
+    def close(self):
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            db.close()
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(size=self.size, opened=self._opened,
+                        idle=self._idle.qsize(), hits=self._hits,
+                        misses=self._misses, waits=self._waits,
+                        wait_time=self._wait_time)
+
+
+class GroupCommitWriter(object):
+    """Run the write statements of all threads on a single writer thread.
+
+    Statements that arrive within ``delay`` seconds of each other are
+    committed together in one transaction, so a burst of writes pays for one
+    commit instead of one per statement.  Each statement runs in its own
+    savepoint: a failing statement is rolled back on its own and its error is
+    raised in the thread that submitted it.
+    """
+
+    def __init__(self, pool, delay=0.002, max_batch=100, timeout=10.0):
+        self.pool = pool
+        self.delay = delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        # connect here, so that errors are raised at startup
+        self._db = self._connect()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _connect(self):
+        db = self.pool.connect()
+        # we commit explicitly, and once per batch, so make each one count
+        db.isolation_level = None
+        db.execute('pragma synchronous = full')
+        return db
+
+    def execute(self, stmt, params=(), timeout=None):
+        """Run ``stmt`` and wait until it is committed.
+
+        Returns the ``lastrowid`` of the statement.  If the writer has not
+        started to run the statement within ``timeout`` seconds, the
+        writer's ``timeout`` by default, the statement is dropped and
+        ``DatabaseBusy`` is raised.  Once the writer has started on it, this
+        waits for its outcome, so that an error always means that nothing
+        was written.
+        """
+        future = Future()
+        self._queue.put((stmt, params, future))
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise DatabaseBusy('write not committed in time')
+        # the writer is running it, and always finishes what it runs
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # leave out the statements whose callers have given up
+            batch = [(stmt, params, future) for stmt, params, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._commit(self._db, batch)
+            except Exception as e:
+                # if this thread died, every later write would wait in vain
+                log.exception('Writing to the database failed')
+                for stmt, params, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._reconnect()
+        self._db.close()
+
+    def _reconnect(self):
+        # the connection may be stuck in a transaction, start over
+        try:
+            self._db.close()
+        except Exception:
+            pass
+        try:
+            self._db = self._connect()
+        except Exception:
+            # the next batch fails on the closed connection, and tries again
+            log.exception('Reconnecting to the database failed')
+
+    def _commit(self, db, batch):
+        results = []
+        try:
+            db.execute('begin immediate')
+            for stmt, params, future in batch:
+                db.execute('savepoint write')
+                try:
+                    cursor = db.execute(stmt, params)
+                except Exception as e:
+                    db.execute('rollback to write')
+                    results.append((future, None, e))
+                else:
+                    results.append((future, cursor.lastrowid, None))
+                db.execute('release write')
+            db.execute('commit')
+        except Exception as e:
+            if db.in_transaction:
+                db.execute('rollback')
+            for stmt, params, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+class VersionedCache(object):
+    """A cache shared by all threads that is emptied on every write.
+
+    ``version`` goes up on every write to the database, by any connection
+    of any process: the cache watches SQLite's ``data_version`` on a
+    connection of its own, which changes whenever another connection
+    commits.  ``invalidate`` bumps it at once, for the writes of this
+    process.  A value computed while the version changed is returned to its
+    caller but never stored, so that a reader racing with a writer cannot
+    put stale data back into the cache.
+    """
+
+    def __init__(self, path, max_entries=100):
+        self.max_entries = max_entries
+        self.version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        # only ever reads the pragma, so it never holds a database lock
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._data_version = self._read_data_version()
+
+    def _read_data_version(self):
+        return self._db.execute('pragma data_version').fetchone()[0]
+
+    def _check(self):
+        # called with the lock held, which also guards the connection
+        data_version = self._read_data_version()
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self.version += 1
+            self._entries.clear()
+
+    def get(self, key, create):
+        with self._lock:
+            self._check()
+            version = self.version
+            try:
+                return self._entries[key]
+            except KeyError:
+                pass
+        value = create()
+        with self._lock:
+            self._check()
+            if self.version == version:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                self._entries[key] = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def schema_statements(script):
+    statement = ''
+    for line in script.splitlines(True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+
 
 # views
 @view_config(route_name='list', renderer='list.mako')
 def list_view(request):
-    rs = request.db.execute('select id, name from tasks where closed = 0')
-    tasks = [dict(id=row[0], name=row[1]) for row in rs.fetchall()]
-    return {'tasks': tasks}
+    cache = request.registry.list_cache
+    page_size = int(request.registry.settings.get('tasks.page_size', 100))
+    try:
+        after = int(request.params.get('after', -1))
+    except ValueError:
+        raise HTTPBadRequest()
+
+    def load_tasks():
+        # one extra row tells us whether there is a next page
+        rs = request.db.execute(
+            'select id, name from tasks where closed = 0 and id > ? '
+            'order by id limit ?', (after, page_size + 1))
+        tasks = [dict(id=row[0], name=row[1]) for row in rs]
+        next_after = None
+        if len(tasks) > page_size:
+            del tasks[page_size:]
+            next_after = tasks[-1]['id']
+        return tasks, next_after
+
+    def render_tasks():
+        tasks, next_after = cache.get(('tasks', after), load_tasks)
+        html = render('tasks.mako', {'tasks': tasks}, request=request)
+        return html, next_after
+
+    # the rendered list contains absolute URLs, so cache it per host
+    key = ('tasks.mako', request.application_url, after)
+    tasks_html, next_after = cache.get(key, render_tasks)
+    return {'tasks_html': tasks_html, 'next_after': next_after}
+
+
+@view_config(route_name='all')
+def all_view(request):
+    # render the page around the list now, while the request is active
+    page = render('list.mako', {'tasks_html': TASKS_MARKER,
+                                'next_after': None}, request=request)
+    head, tail = page.split(TASKS_MARKER)
+    pool = request.registry.db_pool
+    chunk_size = int(request.registry.settings.get('tasks.page_size', 100))
+
+    def app_iter():
+        # request.db is released before the response body is sent
+        db = pool.acquire()
+        try:
+            yield head.encode('utf-8')
+            rs = db.execute('select id, name from tasks where closed = 0 '
+                            'order by id')
+            rows = rs.fetchmany(chunk_size)
+            if not rows:
+                yield render('tasks.mako', {'tasks': []},
+                             request=request).encode('utf-8')
+            while rows:
+                tasks = [dict(id=row[0], name=row[1]) for row in rows]
+                yield render('tasks.mako', {'tasks': tasks},
+                             request=request).encode('utf-8')
+                rows = rs.fetchmany(chunk_size)
+            yield tail.encode('utf-8')
+        finally:
+            pool.release(db)
+
+    return Response(app_iter=app_iter(), content_type='text/html',
+                    charset='utf-8')
+
+
+@view_config(route_name='search', renderer='search.mako')
+def search_view(request):
+    page_size = int(request.registry.settings.get('tasks.page_size', 100))
+    q = request.params.get('q', '').strip()
+    try:
+        page = int(request.params.get('page', 1))
+    except ValueError:
+        raise HTTPBadRequest()
+    if page < 1:
+        raise HTTPBadRequest()
+    tasks = []
+    next_page = None
+    if q:
+        # best matches first, one extra row tells us whether there is more
+        rs = request.db.execute(
+            'select tasks.id, tasks.name from tasks_search '
+            'join tasks on tasks.id = tasks_search.rowid '
+            'where tasks_search match ? and tasks.closed = 0 '
+            'order by tasks_search.rank, tasks.id limit ? offset ?',
+            (match_expression(q), page_size + 1, (page - 1) * page_size))
+        tasks = [dict(id=row[0], name=row[1]) for row in rs]
+        if len(tasks) > page_size:
+            del tasks[page_size:]
+            next_page = page + 1
+    return {'q': q, 'tasks': tasks, 'next_page': next_page}
+
+
+def match_expression(text):
+    # quote every word, so that user input is never parsed as FTS5 syntax,
+    # and let the last one match as a prefix while it is being typed
+    words = ['"%s"' % word.replace('"', '""') for word in text.split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+@view_config(route_name='import', request_method='POST', renderer='json')
+def import_view(request):
+    read_tasks = IMPORT_FORMATS.get(request.content_type)
+    if read_tasks is None:
+        raise HTTPUnsupportedMediaType()
+    # decode and parse the body as it arrives, instead of reading it all
+    f = io.TextIOWrapper(request.body_file, encoding='utf-8-sig', newline='')
+    db = request.db
+    count = 0
+    try:
+        tasks = import_values(read_tasks(f))
+        # stage the tasks in a temporary table, so that a slow upload does
+        # not keep other writers waiting, and copy them over at the end
+        db.execute('begin')
+        db.execute('create temp table tasks_import (name, closed)')
+        chunk = list(itertools.islice(tasks, BULK_CHUNK_SIZE))
+        while chunk:
+            db.executemany('insert into temp.tasks_import (name, closed) '
+                           'values (?, ?)', chunk)
+            count += len(chunk)
+            chunk = list(itertools.islice(tasks, BULK_CHUNK_SIZE))
+        db.execute('insert into tasks (name, closed) '
+                   'select name, closed from temp.tasks_import')
+        db.execute('drop table temp.tasks_import')
+        db.commit()
+    except (ValueError, csv.Error) as e:
+        # the transaction is rolled back when the connection is released
+        raise HTTPBadRequest(str(e))
+    request.registry.list_cache.invalidate()
+    return {'imported': count}
+
+
+@view_config(route_name='export')
+def export_view(request):
+    format = request.matchdict['format']
+    content_type, header, write_tasks = EXPORT_FORMATS[format]
+    pool = request.registry.db_pool
+
+    def app_iter():
+        # like the all_view, send the rows as they are read
+        db = pool.acquire()
+        try:
+            yield header.encode('utf-8')
+            rs = db.execute('select id, name, closed from tasks order by id')
+            rows = rs.fetchmany(BULK_CHUNK_SIZE)
+            while rows:
+                yield write_tasks(rows).encode('utf-8')
+                rows = rs.fetchmany(BULK_CHUNK_SIZE)
+        finally:
+            pool.release(db)
+
+    response = Response(app_iter=app_iter(), content_type=content_type,
+                        charset='utf-8')
+    response.content_disposition = 'attachment; filename=tasks.%s' % format
+    return response
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    if 'name' not in (reader.fieldnames or ()):
+        raise ValueError('the first row must name the columns, '
+                         'including a name column')
+    return reader
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def import_values(tasks):
+    for number, task in enumerate(tasks, 1):
+        if not isinstance(task, dict) or not task.get('name'):
+            raise ValueError('task %d has no name' % number)
+        try:
+            closed = int(task.get('closed') or 0)
+        except (TypeError, ValueError):
+            closed = None
+        if closed not in (0, 1):
+            raise ValueError('task %d: closed must be 0 or 1' % number)
+        yield str(task['name']), closed
+
+
+def write_csv(rows):
+    f = io.StringIO()
+    csv.writer(f).writerows(rows)
+    return f.getvalue()
+
+
+def write_jsonl(rows):
+    lines = []
+    for row in rows:
+        task = {'id': row[0], 'name': row[1], 'closed': bool(row[2])}
+        lines.append(json.dumps(task) + '\n')
+    return ''.join(lines)
+
+
+IMPORT_FORMATS = {
+    'text/csv': read_csv,
+    'application/x-ndjson': read_jsonl,
+    'application/jsonl': read_jsonl,
+}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'id,name,closed\r\n', write_csv),
+    'jsonl': ('application/x-ndjson', '', write_jsonl),
+}
 
 
 @view_config(route_name='new', renderer='new.mako')
 def new_view(request):
     if request.method == 'POST':
         if request.POST.get('name'):
-            request.db.execute(
+            request.registry.db_writer.execute(
                 'insert into tasks (name, closed) values (?, ?)',
                 [request.POST['name'], 0])
-            request.db.commit()
+            request.registry.list_cache.invalidate()
             request.session.flash('New task was successfully added!')
             return HTTPFound(location=request.route_url('list'))
         else:
@@ -45,9 +567,9 @@ def new_view(request):
 @view_config(route_name='close')
 def close_view(request):
     task_id = int(request.matchdict['id'])
-    request.db.execute('update tasks set closed = ? where id = ?',
-                       (1, task_id))
-    request.db.commit()
+    request.registry.db_writer.execute(
+        'update tasks set closed = ? where id = ?', (1, task_id))
+    request.registry.list_cache.invalidate()
     request.session.flash('Task was successfully closed!')
     return HTTPFound(location=request.route_url('list'))
 
@@ -58,52 +580,439 @@ def notfound_view(request):
     return {}
 
 
-# subscribers
-@subscriber(NewRequest)
-def new_request_subscriber(event):
-    request = event.request
-    settings = request.registry.settings
-    request.db = sqlite3.connect(settings['db'])
+@view_config(context=DatabaseBusy)
+def busy_view(request):
+    log.warning('%s: %s', request.path, request.exception)
+    response = Response(text='The database is busy, please try again.',
+                        status='503 Service Unavailable',
+                        content_type='text/plain')
+    response.retry_after = 1
+    return response
+
+
+# request methods
+def open_db_connection(request):
+    # only called the first time a request uses request.db
+    db = request.registry.db_pool.acquire()
     request.add_finished_callback(close_db_connection)
+    return db
 
 
 def close_db_connection(request):
-    request.db.close()
+    request.registry.db_pool.release(request.db)
+
 
+def flash_messages(request):
+    # a browser without a session cookie has no messages waiting, so don't
+    # create a session for it; 'session' is the session factory's cookie name
+    if 'session' not in request.cookies:
+        return []
+    if not request.session.peek_flash():
+        return []
+    return request.session.pop_flash()
 
+
+# subscribers
 @subscriber(ApplicationCreated)
 def application_created_subscriber(event):
-    log.warning('Initializing database...')
     with open(os.path.join(here, 'schema.sql')) as f:
         stmt = f.read()
-        settings = event.app.registry.settings
-        db = sqlite3.connect(settings['db'])
-        db.executescript(stmt)
-        db.commit()
+    # the version is a checksum of the schema, it fits in user_version
+    version = zlib.crc32(stmt.encode('utf-8')) & 0x7fffffff
+    settings = event.app.registry.settings
+    db = sqlite3.connect(settings['db'], isolation_level=None)
+    try:
+        if db.execute('pragma user_version').fetchone()[0] != version:
+            db.execute('begin immediate')
+            # another process may have done it while we waited for the lock
+            if db.execute('pragma user_version').fetchone()[0] != version:
+                log.warning('Initializing database...')
+                for statement in schema_statements(stmt):
+                    db.execute(statement)
+                db.execute('pragma user_version = %d' % version)
+            db.execute('commit')
+    finally:
+        db.close()
+    registry = event.app.registry
+    registry.db_pool = ConnectionPool(
+        settings['db'],
+        size=int(settings.get('db.pool_size', 5)),
+        timeout=float(settings.get('db.pool_timeout', 10)),
+        pragmas=['pragma journal_mode = wal',
+                 'pragma synchronous = normal'])
+    registry.db_writer = GroupCommitWriter(
+        registry.db_pool,
+        delay=float(settings.get('db.commit_delay', 0.002)),
+        timeout=float(settings.get('db.write_timeout', 10)))
+    registry.list_cache = VersionedCache(settings['db'])
 
 
-if __name__ == '__main__':
-    # configuration settings
-    settings = {}
-    settings['reload_all'] = True
-    settings['debug_all'] = True
-    settings['db'] = os.path.join(here, 'tasks.db')
-    settings['mako.directories'] = os.path.join(here, 'templates')
+# configuration
+def make_config(settings):
     # session factory
     session_factory = UnencryptedCookieSessionFactoryConfig('itsaseekreet')
     # configuration setup
     config = Configurator(settings=settings, session_factory=session_factory)
     # add mako templating
     config.include('pyramid_mako')
+    # request methods setup
+    config.add_request_method(open_db_connection, 'db', reify=True)
+    config.add_request_method(flash_messages, 'flash_messages', reify=True)
     # routes setup
     config.add_route('list', '/')
+    config.add_route('all', '/all')
+    config.add_route('search', '/search')
+    config.add_route('import', '/import')
+    config.add_route('export', '/export.{format:csv|jsonl}')
     config.add_route('new', '/new')
     config.add_route('close', '/close/{id}')
     # static view setup
     config.add_static_view('static', os.path.join(here, 'static'))
     # scan for @view_config and @subscriber decorators
     config.scan()
-    # serve app
+    return config
+
+
+# server
+class RequestBody(object):
+    """The body of one request, read from a connection that may carry more."""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+class KeepAliveServerHandler(ServerHandler):
+    http_version = '1.1'
+
+    def cleanup_headers(self):
+        ServerHandler.cleanup_headers(self)
+        # without a length, only closing the connection ends the response
+        if 'Content-Length' not in self.headers:
+            self.request_handler.close_connection = True
+        if self.request_handler.close_connection:
+            self.headers['Connection'] = 'close'
+
+    def handle_error(self):
+        self.request_handler.close_connection = True
+        ServerHandler.handle_error(self)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Serve the requests waiting on a HTTP/1.1 connection.
+
+    Once no more requests are waiting, the connection goes back to the
+    server, which waits for the next one without holding a thread.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.timeout = self.server.keep_alive
+        WSGIRequestHandler.setup(self)
+        # headers and body are separate writes, send them without delay
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        # the connection is only handed to us when a request has arrived
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.request_waiting():
+            self.handle_one_request()
+
+    def request_waiting(self):
+        # Whether the next request has already arrived.  It may be in the
+        # buffer of rfile, where the server cannot see it, so look without
+        # blocking.
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+        if 'Transfer-Encoding' in self.headers:
+            # we only know where bodies with a Content-Length end
+            self.close_connection = True
+        length = self.headers['Content-Length'] or '0'
+        if not (length.isascii() and length.isdigit()):
+            # a negative length would read until the client gives up
+            self.send_error(400, 'Bad Content-Length')
+            return
+        body = RequestBody(self.rfile, int(length))
+        handler = KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=True, multiprocess=self.server.multiprocess)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+        # skip what the application did not read, up to the next request
+        while body.read(65536):
+            pass
+
+
+class IdleConnections(object):
+    """Wait for the next request on connections without holding a thread.
+
+    One thread watches the connections with a selector, and passes each one
+    to ``ready`` once there is something to read on it.  Connections that
+    stay idle for ``timeout`` seconds are passed to ``close``.
+    """
+
+    def __init__(self, ready, close, timeout):
+        self.ready = ready
+        self.close_connection = close
+        self.timeout = timeout
+        self._added = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        # threads and selectors don't survive a fork, so make them here,
+        # in the process that serves
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._waker = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._waker.setblocking(False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run,
+                                        name='idle-connections')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, request, client_address):
+        with self._lock:
+            closed = self._closed or self._thread is None
+            if not closed:
+                self._added.append((request, client_address))
+        if closed:
+            self.close_connection(request)
+        else:
+            self._wake()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        if self._thread is not None:
+            self._wake()
+            self._thread.join()
+
+    def _wake(self):
+        try:
+            self._waker.send(b'x')
+        except BlockingIOError:
+            # plenty of wake ups are waiting already
+            pass
+
+    def _run(self):
+        selector = self._selector
+        # connection -> when it expires.  Every connection is given the
+        # same timeout when it is added, so the first one expires first.
+        deadlines = {}
+        while True:
+            timeout = None
+            if deadlines:
+                first = next(iter(deadlines.values()))
+                timeout = max(first - time.monotonic(), 0)
+            for key, events in selector.select(timeout):
+                if key.fileobj is self._wakeup:
+                    try:
+                        while self._wakeup.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                selector.unregister(key.fileobj)
+                del deadlines[key.fileobj]
+                self.ready(key.fileobj, key.data)
+            with self._lock:
+                added, self._added = self._added, []
+                closed = self._closed
+            now = time.monotonic()
+            for request, client_address in added:
+                selector.register(request, selectors.EVENT_READ,
+                                  client_address)
+                deadlines[request] = now + self.timeout
+            for request, deadline in list(deadlines.items()):
+                if deadline > now and not closed:
+                    break
+                selector.unregister(request)
+                del deadlines[request]
+                self.close_connection(request)
+            if closed:
+                break
+        selector.close()
+        self._wakeup.close()
+        self._waker.close()
+
+
+class ThreadPoolServer(WSGIServer):
+    """A WSGI server that serves requests on a bounded pool of threads.
+
+    A thread is only taken once a request has arrived: connections waiting
+    for their first or next request are watched by ``IdleConnections``.
+    """
+
+    multiprocess = False
+
+    def __init__(self, address, threads=8, keep_alive=5.0):
+        WSGIServer.__init__(self, address, KeepAliveRequestHandler)
+        self.keep_alive = keep_alive
+        self.executor = ThreadPoolExecutor(threads)
+        self.idle = IdleConnections(self.submit_request,
+                                    self.shutdown_request, keep_alive)
+
+    def serve_forever(self, poll_interval=0.5):
+        self.idle.start()
+        WSGIServer.serve_forever(self, poll_interval)
+
+    def process_request(self, request, client_address):
+        # new connections wait for their first request like idle ones
+        self.idle.add(request, client_address)
+
+    def submit_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request,
+                             client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def process_request_thread(self, request, client_address):
+        keep = False
+        try:
+            handler = self.finish_request(request, client_address)
+            keep = not handler.close_connection
+        except Exception:
+            self.handle_error(request, client_address)
+        if keep:
+            self.idle.add(request, client_address)
+        else:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        WSGIServer.server_close(self)
+        # close the idle connections, and let the requests in progress
+        # finish; their connections are closed after them
+        self.idle.close()
+        self.executor.shutdown(wait=True)
+
+
+def run_server(server, config):
+    # every process makes its own app, which opens its own connections
     app = config.make_wsgi_app()
-    server = make_server('0.0.0.0', 8080, app)
-    server.serve_forever()
+    server.set_app(app)
+
+    def stop(signum, frame):
+        # shutdown waits for serve_forever to return, so it needs a thread
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        app.registry.db_writer.close()
+        app.registry.db_pool.close()
+        app.registry.list_cache.close()
+
+
+def serve(config, host, port, threads=8, workers=0, keep_alive=5.0):
+    """Serve the application until it receives SIGTERM or SIGINT.
+
+    With ``workers`` set, fork that many worker processes that share the
+    listening socket, each with ``threads`` threads.
+    """
+    server = ThreadPoolServer((host, port), threads, keep_alive)
+    log.warning('Serving on http://%s:%s', host, port)
+    if not workers:
+        run_server(server, config)
+        return
+    server.multiprocess = True
+    # workers race for new connections, the losers must not block
+    server.socket.setblocking(False)
+    children = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_server(server, config)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+    server.socket.close()
+
+
+if __name__ == '__main__':
+    # command line options
+    parser = argparse.ArgumentParser(description='Serve the tasks app.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads per process (default: 8)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='worker processes to fork (default: 0, serve '
+                             'from this process)')
+    parser.add_argument('--keep-alive', type=float, default=5,
+                        help='seconds to keep idle connections open '
+                             '(default: 5)')
+    options = parser.parse_args()
+    # configuration settings
+    settings = {}
+    settings['reload_all'] = True
+    settings['debug_all'] = True
+    settings['db'] = os.path.join(here, 'tasks.db')
+    settings['db.pool_size'] = options.threads
+    settings['db.commit_delay'] = 0.002
+    settings['tasks.page_size'] = 100
+    settings['mako.directories'] = os.path.join(here, 'templates')
+    # serve app
+    config = make_config(settings)
+    serve(config, options.host, options.port, threads=options.threads,
+          workers=options.workers, keep_alive=options.keep_alive)
@@ -13,14 +13,15 @@
 
 <body>
 
-  % if request.session.peek_flash():
+  <%block name="flash">
+  % if request.flash_messages:
   <div id="flash">
-    <% flash = request.session.pop_flash() %>
-	% for message in flash:
+	% for message in request.flash_messages:
 	${message}<br>
 	% endfor
   </div>
   % endif
+  </%block>
 
   <div id="page">
     
@@ -4,19 +4,15 @@
 <h1>Task's List</h1>
 
 <ul id="tasks">
-% if tasks:
-  % for task in tasks:
+${tasks_html | n}
+% if next_after is not None:
   <li>
-    <span class="name">${task['name']}</span>
-    <span class="actions">
-      [ <a href="${request.route_url('close', id=task['id'])}">close</a> ]
-    </span>
+    <a href="${request.route_url('list', _query={'after': next_after})}">More tasks</a>
+    | <a href="${request.route_url('all')}">All tasks</a>
   </li>
-  % endfor
-% else:
-  <li>There are no open tasks</li>
 % endif
   <li class="last">
     <a href="${request.route_url('new')}">Add a new task</a>
+    | <a href="${request.route_url('search')}">Search tasks</a>
   </li>
 </ul>
\ No newline at end of file
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*- 
 <%inherit file="layout.mako"/>
 
+## leave flash messages for the next page, without loading the session
+<%block name="flash"/>
+
 <div id="notfound">
   <h1>404 - PAGE NOT FOUND</h1>
   The page you're looking for isn't here.
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*- 
+<%inherit file="layout.mako"/>
+
+<h1>Search tasks</h1>
+
+<form action="${request.route_url('search')}" method="get">
+  <input type="text" maxlength="100" name="q" value="${q}">
+  <input type="submit" value="SEARCH" class="button">
+</form>
+
+% if q:
+<ul id="tasks">
+  % if tasks:
+  <%include file="tasks.mako"/>
+  % else:
+  <li>No open tasks match your search</li>
+  % endif
+  % if next_page is not None:
+  <li>
+    <a href="${request.route_url('search', _query={'q': q, 'page': next_page})}">More results</a>
+  </li>
+  % endif
+  <li class="last">
+    <a href="${request.route_url('list')}">Back to the list</a>
+  </li>
+</ul>
+% endif
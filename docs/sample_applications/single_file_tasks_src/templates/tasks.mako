@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*- 
+% if tasks:
+  % for task in tasks:
+  <li>
+    <span class="name">${task['name']}</span>
+    <span class="actions">
+      [ <a href="${request.route_url('close', id=task['id'])}">close</a> ]
+    </span>
+  </li>
+  % endfor
+% else:
+  <li>There are no open tasks</li>
+% endif
@@ -0,0 +1,116 @@
+"""Measure the memory used by large trees of the tutorial's resources.
+
+Builds a tree of folders, each holding documents, once with the resources
+in ``tutorial/resources.py`` and once with the plain ``dict`` based
+resources of the earlier steps, and reports the bytes allocated per node and
+the time taken to build each tree as JSON::
+
+    $ python bench.py --nodes 1000000 --fanout 1000 --output after.json
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from tutorial import resources
+
+
+# the resources of the earlier steps, for comparison
+class DictFolder(dict):
+    def __init__(self, name, parent, title):
+        self.__name__ = name
+        self.__parent__ = parent
+        self.title = title
+
+
+class DictDocument(object):
+    def __init__(self, name, parent, title):
+        self.__name__ = name
+        self.__parent__ = parent
+        self.title = title
+
+
+def build_slots(nodes, fanout):
+    root = resources.Root('', None, 'Root')
+    folders = {}
+    for i in range(max(nodes // (fanout + 1), 1)):
+        folder = resources.Folder('folder%d' % i, root, 'Folder %d' % i)
+        folder.update(
+            ('doc%d' % j, resources.Document('doc%d' % j, folder,
+                                             'Document %d' % j))
+            for j in range(fanout))
+        folders[folder.__name__] = folder
+    root.update(folders)
+    return root
+
+
+def build_dict(nodes, fanout):
+    root = DictFolder('', None, 'Root')
+    for i in range(max(nodes // (fanout + 1), 1)):
+        folder = root['folder%d' % i] = DictFolder(
+            'folder%d' % i, root, 'Folder %d' % i)
+        for j in range(fanout):
+            folder['doc%d' % j] = DictDocument(
+                'doc%d' % j, folder, 'Document %d' % j)
+    return root
+
+
+BUILDERS = {'slots': build_slots, 'dict': build_dict}
+
+
+def count(root):
+    return 1 + sum(len(folder) + 1 for folder in root.values())
+
+
+def measure(build, nodes, fanout):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    root = build(nodes, fanout)
+    duration = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    built = count(root)
+    return {
+        'nodes': built,
+        'build_seconds': duration,
+        'bytes': current,
+        'bytes_per_node': current / float(built),
+        'peak_bytes': peak,
+    }
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=1000000,
+                        help='nodes in each tree (default: 1000000)')
+    parser.add_argument('--fanout', type=int, default=1000,
+                        help='documents in each folder (default: 1000)')
+    parser.add_argument('--only', choices=sorted(BUILDERS),
+                        help='measure only one kind of tree')
+    parser.add_argument('--output', help='write the results to this file')
+    options = parser.parse_args(argv)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'options': {'nodes': options.nodes, 'fanout': options.fanout},
+    }
+    for name in sorted(BUILDERS):
+        if options.only in (None, name):
+            results[name] = measure(BUILDERS[name], options.nodes,
+                                    options.fanout)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,73 @@
-class Folder(dict):
+import threading
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 has intern as a builtin
+    pass
+
+# Held while changing the tree. Reading it needs no lock: see Folder.
+write_lock = threading.RLock()
+
+
+class Folder(object):
+    # __slots__ saves the memory of a __dict__ on every instance. The
+    # children are kept in a dict that is never changed once a folder
+    # holds it: adding children copies it, and replaces it in one step,
+    # so readers always see a complete dict, without locking.
+    __slots__ = ('__name__', '__parent__', 'title', '_children')
+
     def __init__(self, name, parent, title):
-        self.__name__ = name
+        self.__name__ = intern(name)
         self.__parent__ = parent
         self.title = title
+        self._children = {}
+
+    def __getitem__(self, name):
+        return self._children[name]
+
+    def __setitem__(self, name, node):
+        self.update({name: node})
+
+    def update(self, children):
+        # Add many children at once, copying our dict only once.
+        with write_lock:
+            new_children = dict(self._children)
+            for name, node in dict(children).items():
+                new_children[intern(name)] = node
+            self._children = new_children
+
+    def __contains__(self, name):
+        return name in self._children
+
+    def __iter__(self):
+        return iter(self._children)
+
+    def __len__(self):
+        return len(self._children)
+
+    def get(self, name, default=None):
+        return self._children.get(name, default)
+
+    def keys(self):
+        return self._children.keys()
+
+    def values(self):
+        return self._children.values()
+
+    def items(self):
+        return self._children.items()
 
 
 class Root(Folder):
-    pass
+    __slots__ = ()
 
 
 class Document(object):
+    __slots__ = ('__name__', '__parent__', 'title')
+
     def __init__(self, name, parent, title):
-        self.__name__ = name
+        self.__name__ = intern(name)
         self.__parent__ = parent
         self.title = title
 
@@ -20,22 +76,28 @@ root = Root('', None, 'My Site')
 
 
 def bootstrap(request):
-    if not root.values():
-        # No values yet, let's make:
-        # /
-        #   doc1
-        #   doc2
-        #   folder1/
-        #      doc1
-        doc1 = Document('doc1', root, 'Document 01')
-        root['doc1'] = doc1
-        doc2 = Document('doc2', root, 'Document 02')
-        root['doc2'] = doc2
-        folder1 = Folder('folder1', root, 'Folder 01')
-        root['folder1'] = folder1
-
-        # Only has to be unique in folder
-        doc11 = Document('doc1', folder1, 'Document 01')
-        folder1['doc1'] = doc11
-
-    return root
\ No newline at end of file
+    if not root:
+        with write_lock:
+            # another thread may have got here first
+            if not root:
+                make_site()
+    return root
+
+
+def make_site():
+    # Make:
+    # /
+    #   doc1
+    #   doc2
+    #   folder1/
+    #      doc1
+    doc1 = Document('doc1', root, 'Document 01')
+    doc2 = Document('doc2', root, 'Document 02')
+    folder1 = Folder('folder1', root, 'Folder 01')
+
+    # Only has to be unique in folder
+    doc11 = Document('doc1', folder1, 'Document 01')
+    folder1['doc1'] = doc11
+
+    # readers see all of the site or none of it
+    root.update({'doc1': doc1, 'doc2': doc2, 'folder1': folder1})
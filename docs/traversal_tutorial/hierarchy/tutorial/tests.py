@@ -16,6 +16,27 @@ class TutorialViewsUnitTests(unittest.TestCase):
         self.assertIn('Home', result['page_title'])
 
 
+class FolderUnitTests(unittest.TestCase):
+    def test_add_children(self):
+        from .resources import Document, Folder
+
+        folder = Folder('folder', None, 'Folder')
+        folder['doc1'] = Document('doc1', folder, 'Document 01')
+        folder.update({'doc2': Document('doc2', folder, 'Document 02')})
+        self.assertEqual(sorted(folder), ['doc1', 'doc2'])
+        self.assertEqual(folder['doc2'].title, 'Document 02')
+
+    def test_values_unchanged_by_writes(self):
+        from .resources import Document, Folder
+
+        folder = Folder('folder', None, 'Folder')
+        folder['doc1'] = Document('doc1', folder, 'Document 01')
+        values = folder.values()
+        folder['doc2'] = Document('doc2', folder, 'Document 02')
+        self.assertEqual(len(list(values)), 1)
+        self.assertEqual(len(folder.values()), 2)
+
+
 class TutorialFunctionalTests(unittest.TestCase):
     def setUp(self):
         from tutorial import main
@@ -5,6 +5,7 @@ from sqlalchemy import engine_from_config
 from .sqltraversal import (
     DBSession,
     Base,
+    NodeTraverser,
     root_factory,
     )
 
@@ -16,6 +17,7 @@ def main(global_config, **settings):
 
     config = Configurator(settings=settings,
                           root_factory=root_factory)
+    config.add_traverser(NodeTraverser)
     config.include('pyramid_jinja2')
     config.scan('.views')
     return config.make_wsgi_app()
@@ -39,7 +39,7 @@ def main(argv=sys.argv):
     Base.metadata.create_all(engine)
 
     with transaction.manager:
-        root = Folder(name='', title='My SQLTraversal Root')
+        root = Folder(name='', path='/', title='My SQLTraversal Root')
         DBSession.add(root)
         f1 = root['f1'] = Folder(title='Folder 1')
         f1['da'] = Document(title='Document A')
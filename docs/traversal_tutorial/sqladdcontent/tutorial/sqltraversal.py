@@ -1,18 +1,34 @@
+from collections import OrderedDict
+import threading
+
+from pyramid.traversal import (
+    quote_path_segment,
+    split_path_info,
+    )
 from sqlalchemy import (
     Column,
     Integer,
     Unicode,
     ForeignKey,
-    String
+    Index,
+    String,
+    and_,
+    event,
+    func,
+    inspect,
+    literal,
+    or_,
     )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import (
     scoped_session,
     sessionmaker,
     relationship,
-    backref
+    backref,
+    selectin_polymorphic,
     )
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.util import classproperty
 from zope.sqlalchemy import ZopeTransactionExtension
 
@@ -30,7 +46,193 @@ def u(s):
 
 
 def root_factory(request):
-    return DBSession.query(Node).filter_by(parent_id=None).one()
+    return load_nodes([u('/')])[u('/')]
+
+
+def query_nodes(load='joined'):
+    # How to load the columns that Node's subclasses keep in their own
+    # tables: 'joined' outer joins all of those tables into the query,
+    # which suits a few rows; 'selectin' loads them with one more query
+    # per subclass found, which suits long lists; None leaves them until
+    # they are used, for code that only needs the node table's columns.
+    query = DBSession.query(Node)
+    if load == 'joined':
+        query = query.with_polymorphic('*')
+    elif load == 'selectin':
+        subclasses = [mapper.class_ for mapper in
+                      inspect(Node).self_and_descendants
+                      if mapper.class_ is not Node]
+        query = query.options(selectin_polymorphic(Node, subclasses))
+    return query
+
+
+def node_path(parent_path, name):
+    # The path of a node is its URL path below the root, ending in a
+    # slash: '/' for the root, '/f1/da/' for a document in a folder.
+    return parent_path + u(quote_path_segment(name)) + u('/')
+
+
+class NodeCache(object):
+    # A bounded map from node paths to the id and type of each node,
+    # shared by the requests and threads of a process, which forgets
+    # the least recently used paths first. The Node events at the end
+    # of this module forget the paths of nodes that change.
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries[path] = entry
+            self.hits += 1
+            return entry
+
+    def set(self, path, entry):
+        with self.lock:
+            self.entries.pop(path, None)
+            self.entries[path] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, path):
+        # forget a path and every path below it
+        with self.lock:
+            for other in [p for p in self.entries if p.startswith(path)]:
+                del self.entries[other]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
+
+
+node_cache = NodeCache()
+
+
+def load_nodes(paths):
+    # Load the nodes with the given paths, as a dict by path, with one
+    # query. Nodes whose paths are in node_cache are looked up by id,
+    # and when all of them are, only the tables of their types are
+    # joined. A cached id may belong to a node that has since been
+    # deleted or moved by another process, so those paths are looked up
+    # again by path.
+    entries = dict((path, node_cache.get(path)) for path in paths)
+    ids = [entry[0] for entry in entries.values() if entry is not None]
+    uncached = [path for path, entry in entries.items() if entry is None]
+    if uncached:
+        query = query_nodes()
+    else:
+        types = inspect(Node).polymorphic_map
+        query = query_nodes(None).with_polymorphic(
+            set(types[entry[1]].class_ for entry in entries.values()))
+    criteria = []
+    if ids:
+        criteria.append(Node.id.in_(ids))
+    if uncached:
+        criteria.append(Node.path.in_(uncached))
+    found = dict((node.path, node) for node in query.filter(or_(*criteria)))
+    stale = [path for path in paths
+             if entries[path] is not None and path not in found]
+    if stale:
+        for path in stale:
+            node_cache.discard(path)
+        query = query_nodes().filter(Node.path.in_(stale))
+        found.update((node.path, node) for node in query)
+    for path in paths:
+        if path in found:
+            node_cache.set(path, (found[path].id, found[path].type))
+    return dict((path, found[path]) for path in paths if path in found)
+
+
+def link_parents(nodes):
+    # The session only keeps weak references, so link each node to its
+    # parent here, rather than let __parent__ load the parents again.
+    for parent, node in zip(nodes, nodes[1:]):
+        set_committed_value(node, 'parent', parent)
+
+
+def resolve_path(root, names):
+    # Find the nodes named by ``names``, starting below ``root``, with
+    # one query on the path index. Returns the root followed by as many
+    # of the nodes as exist, each with its parent already loaded.
+    paths = []
+    for name in names:
+        paths.append(node_path(paths[-1] if paths else root.path, name))
+    found = {}
+    if paths:
+        found = load_nodes(paths)
+    nodes = [root]
+    for path in paths:
+        if path not in found:
+            break
+        nodes.append(found[path])
+    link_parents(nodes)
+    return nodes
+
+
+class NodeTraverser(object):
+    # Used instead of Pyramid's default traverser, which would call
+    # Node.__getitem__, and make a query, for every name in the path.
+    VIEW_SELECTOR = '@@'
+
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, request):
+        subpath = ()
+        if request.matchdict is None:
+            path = request.path_info or '/'
+        else:
+            path = request.matchdict.get('traverse', '/') or '/'
+            if isinstance(path, tuple):
+                path = '/'.join(path)
+            subpath = request.matchdict.get('subpath', ())
+            if not isinstance(subpath, tuple):
+                subpath = split_path_info(subpath)
+        # path_info and the matchdict are decoded already
+        names = split_path_info(path)
+
+        # an @@ name is always a view name, so stop looking before it
+        nodes_end = len(names)
+        for i, name in enumerate(names):
+            if name.startswith(self.VIEW_SELECTOR):
+                nodes_end = i
+                break
+        nodes = resolve_path(self.root, names[:nodes_end])
+
+        i = len(nodes) - 1
+        view_name = ''
+        if i < len(names):
+            view_name = names[i]
+            if i == nodes_end:
+                view_name = view_name[len(self.VIEW_SELECTOR):]
+            subpath = names[i + 1:]
+        return {
+            'context': nodes[-1],
+            'view_name': view_name,
+            'subpath': subpath,
+            'traversed': names[:i],
+            'virtual_root': self.root,
+            'virtual_root_path': (),
+            'root': self.root,
+        }
 
 
 class Node(Base):
@@ -38,6 +240,7 @@ class Node(Base):
     id = Column(Integer, primary_key=True)
     name = Column(Unicode(50), nullable=False)
     parent_id = Column(Integer, ForeignKey('node.id'))
+    path = Column(Unicode, nullable=False, unique=True)
     children = relationship("Node",
                             backref=backref('parent', remote_side=[id])
     )
@@ -48,26 +251,60 @@ class Node(Base):
         return dict(
             polymorphic_on='type',
             polymorphic_identity=cls.__name__.lower(),
-            with_polymorphic='*',
         )
 
     def __setitem__(self, key, node):
-        node.name = u(key)
+        self.update([(key, node)])
+
+    def update(self, children):
+        # Add many children, given as a mapping or as (name, node) pairs,
+        # with a single flush. Setting parent_id rather than parent keeps
+        # SQLAlchemy from loading all of our existing children first.
+        if hasattr(children, 'items'):
+            children = children.items()
         if self.id is None:
             DBSession.flush()
-        node.parent_id = self.id
-        DBSession.add(node)
+        for key, node in children:
+            node.name = u(key)
+            node.path = node_path(self.path, node.name)
+            node.parent_id = self.id
+            DBSession.add(node)
         DBSession.flush()
 
     def __getitem__(self, key):
+        path = node_path(self.path, key)
         try:
-            return DBSession.query(Node).filter_by(
-                name=key, parent=self).one()
-        except NoResultFound:
+            return load_nodes([path])[path]
+        except KeyError:
             raise KeyError(key)
 
-    def values(self):
-        return DBSession.query(Node).filter_by(parent=self)
+    def values(self, after=None, limit=None, load='selectin'):
+        # The children in the order of their paths, which the node_children
+        # index below serves. For the next page, pass the name of the last
+        # child as ``after``. Iterating fetches rows in batches of 100.
+        # See query_nodes for ``load``.
+        query = query_nodes(load).filter(
+            Node.parent_id == self.id).order_by(Node.path)
+        if after is not None:
+            query = query.filter(Node.path > node_path(self.path, after))
+        if limit is not None:
+            query = query.limit(limit)
+        return query.yield_per(100)
+
+    def __len__(self):
+        return DBSession.query(func.count(Node.id)).filter(
+            Node.parent_id == self.id).scalar()
+
+    def __contains__(self, key):
+        query = DBSession.query(Node.id).filter_by(
+            path=node_path(self.path, key))
+        return DBSession.query(query.exists()).scalar()
+
+    def __bool__(self):
+        # __len__ would make an empty node false, unlike other resources
+        return True
+
+    __nonzero__ = __bool__
 
     @property
     def __name__(self):
@@ -75,4 +312,78 @@ class Node(Base):
 
     @property
     def __parent__(self):
+        # if the parent is not in the session yet, neither are the nodes
+        # above it, so load them all at once instead of one at a time
+        if self.parent_id is not None and (
+                identity_key(Node, self.parent_id)
+                not in DBSession.identity_map):
+            self.load_parents()
         return self.parent
+
+    @property
+    def depth(self):
+        return self.path.count('/') - 1
+
+    def load_parents(self):
+        paths = [self.path[:i + 1]
+                 for i, c in enumerate(self.path[:-1]) if c == '/']
+        query = query_nodes().filter(Node.path.in_(paths))
+        found = dict((node.path, node) for node in query)
+        link_parents([found[path] for path in paths] + [self])
+
+    def descendants(self, load=None):
+        # The paths below this node's path sort between it and the same
+        # path ending in '0', the character after '/', so this is one
+        # range scan of the path index. See query_nodes for ``load``.
+        return query_nodes(load).filter(
+            Node.path > self.path, Node.path < self.path[:-1] + '0')
+
+    def move(self, parent, name=None):
+        # Move this node and everything below it into ``parent``: one
+        # UPDATE rewrites the start of the paths of the whole subtree.
+        name = u(self.name if name is None else name)
+        old = self.path
+        new = node_path(parent.path, name)
+        if parent.path.startswith(old):
+            raise ValueError('Cannot move a node into itself')
+        node = Node.__table__
+        DBSession.flush()
+        DBSession.execute(node.update().where(and_(
+            node.c.path > old, node.c.path < old[:-1] + '0',
+        )).values(path=literal(new) + func.substr(node.c.path, len(old) + 1)))
+        forget_path(DBSession(), old)
+        # the moved nodes already in the session have stale paths
+        for other in list(DBSession.identity_map.values()):
+            if inspect(other).dict.get('path', '').startswith(old):
+                DBSession.expire(other, ['path'])
+        self.name = name
+        self.path = new
+        self.parent = parent
+        DBSession.flush()
+
+
+# the children of a node, in order: see Node.values
+Index('node_children', Node.parent_id, Node.path)
+
+
+def forget_path(session, path):
+    # Forget a path, and those below it, now and again once the session's
+    # transaction ends, in case another request cached it in between.
+    node_cache.discard(path)
+    session.info.setdefault('forget_paths', set()).add(path)
+
+
+@event.listens_for(Node, 'after_insert', propagate=True)
+@event.listens_for(Node, 'after_update', propagate=True)
+@event.listens_for(Node, 'after_delete', propagate=True)
+def forget_node(mapper, connection, target):
+    state = inspect(target)
+    for path in set(state.attrs.path.history.sum()):
+        forget_path(state.session, path)
+
+
+@event.listens_for(DBSession, 'after_transaction_end')
+def forget_session_paths(session, transaction):
+    if transaction.parent is None:
+        for path in session.info.pop('forget_paths', ()):
+            node_cache.discard(path)
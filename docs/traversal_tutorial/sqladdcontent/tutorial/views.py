@@ -1,5 +1,6 @@
 from random import randint
 
+from pyramid.decorator import reify
 from pyramid.httpexceptions import HTTPFound
 from pyramid.location import lineage
 from pyramid.view import view_config
@@ -10,12 +11,25 @@ from .models import (
     )
 
 
+PAGE_SIZE = 50
+
+
 class TutorialViews(object):
     def __init__(self, context, request):
         self.context = context
         self.request = request
         self.parents = reversed(list(lineage(context)))
 
+    @reify
+    def contents(self):
+        # A page of the context's children, and the name to pass as
+        # ``after`` for the next page, if there is one.
+        children = list(self.context.values(
+            after=self.request.params.get('after'), limit=PAGE_SIZE + 1))
+        if len(children) > PAGE_SIZE:
+            return children[:PAGE_SIZE], children[PAGE_SIZE - 1].__name__
+        return children, None
+
     @view_config(renderer='templates/root.jinja2',
                  context=Folder, custom_predicates=[lambda c, r: c is r.root])
     def root(self):
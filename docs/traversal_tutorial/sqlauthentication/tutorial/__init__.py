@@ -1,5 +1,4 @@
 from pyramid.authentication import AuthTktAuthenticationPolicy
-from pyramid.authorization import ACLAuthorizationPolicy
 from pyramid.config import Configurator
 
 from sqlalchemy import engine_from_config
@@ -9,7 +8,10 @@ from .models import (
     Base,
     root_factory
     )
-from .security import groupfinder
+from .security import (
+    CachingACLAuthorizationPolicy,
+    groupfinder
+    )
 
 
 def main(global_config, **settings):
@@ -25,7 +27,7 @@ def main(global_config, **settings):
     authn_policy = AuthTktAuthenticationPolicy(
         settings['tutorial.secret'], callback=groupfinder,
         hashalg='sha512')
-    authz_policy = ACLAuthorizationPolicy()
+    authz_policy = CachingACLAuthorizationPolicy()
     config.set_authentication_policy(authn_policy)
     config.set_authorization_policy(authz_policy)
 
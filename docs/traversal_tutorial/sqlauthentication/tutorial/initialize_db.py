@@ -8,6 +8,10 @@ from pyramid.paster import (
     get_appsettings,
     setup_logging,
     )
+from pyramid.security import (
+    Allow,
+    Everyone,
+    )
 
 from .models import (
     DBSession,
@@ -37,7 +41,9 @@ def main(argv=sys.argv):
     Base.metadata.create_all(engine)
 
     with transaction.manager:
-        root = Root(name='', title='My SQLTraversal Root')
+        root = Root(name='', path='/', title='My SQLTraversal Root')
+        root.__acl__ = [(Allow, Everyone, 'view'),
+                        (Allow, 'group:editors', 'edit')]
         DBSession.add(root)
         DBSession.flush()
         root = DBSession.query(Node).filter_by(name=u'').one()
@@ -1,8 +1,224 @@
-USERS = {'editor': 'editor',
-         'viewer': 'viewer'}
+import binascii
+from collections import OrderedDict
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.httpexceptions import HTTPServiceUnavailable
+from pyramid.security import (
+    Allow,
+    ACLAllowed,
+    ACLDenied,
+    )
+from pyramid.util import is_nonstr_iter
+
+
+def hash_password(password, salt=None, iterations=100000):
+    # PBKDF2 is slow on purpose, to make guessing passwords from stolen
+    # hashes slow too: this takes tens of milliseconds.
+    if salt is None:
+        salt = binascii.hexlify(os.urandom(16)).decode('ascii')
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'),
+                                 salt.encode('ascii'), iterations)
+    return 'pbkdf2_sha256$%d$%s$%s' % (
+        iterations, salt, binascii.hexlify(digest).decode('ascii'))
+
+
+def check_hash(password, stored):
+    algorithm, iterations, salt, digest = stored.split('$')
+    return hmac.compare_digest(
+        hash_password(password, salt, int(iterations)), stored)
+
+
+# A real application would keep the hashes, rather than the passwords.
+USERS = {'editor': hash_password('editor'),
+         'viewer': hash_password('viewer')}
 GROUPS = {'editor': ['group:editors']}
 
+# Checked instead of the hash of a user that doesn't exist, which takes as
+# long, so that timing a failed login doesn't tell which users exist.
+DUMMY_HASH = hash_password(binascii.hexlify(os.urandom(16)).decode('ascii'))
+
+
+class CredentialVerifier(object):
+    # Checks passwords against their hashes, at most ``max_running`` at
+    # once. Another check waits up to ``wait`` seconds for its turn, then
+    # gives up with 503 Service Unavailable. The hash is
+    # computed in the request's own thread, which waits for it; as
+    # hashlib releases the GIL meanwhile, other threads keep serving.
+    # Credentials it has verified are remembered for ``ttl`` seconds, by
+    # an HMAC of them under a key made for this process, not by the
+    # password itself. The HMAC covers the stored hash, so changing a
+    # password forgets the old one.
+
+    def __init__(self, max_running=4, wait=1, ttl=60, size=10000):
+        self.slots = threading.BoundedSemaphore(max_running)
+        self.wait = wait
+        self.key = os.urandom(32)
+        self.ttl = ttl
+        self.size = size
+        self.verified = OrderedDict()
+        self.lock = threading.Lock()
+
+    def verify(self, userid, password, stored):
+        message = u'\0'.join([userid, password, stored]).encode('utf-8')
+        mac = hmac.new(self.key, message, hashlib.sha256).digest()
+        with self.lock:
+            expires = self.verified.pop(mac, None)
+            if expires is not None and expires > time.time():
+                self.verified[mac] = expires
+                return True
+        if not self.slots.acquire(timeout=self.wait):
+            raise HTTPServiceUnavailable('Too many logins at once')
+        try:
+            valid = check_hash(password, stored)
+        finally:
+            self.slots.release()
+        if valid:
+            with self.lock:
+                self.verified[mac] = time.time() + self.ttl
+                while len(self.verified) > self.size:
+                    self.verified.popitem(last=False)
+        return valid
+
+
+verifier = CredentialVerifier()
+
+
+def check_password(userid, password):
+    stored = USERS.get(userid)
+    if stored is None:
+        verifier.verify(userid, password, DUMMY_HASH)
+        return False
+    return verifier.verify(userid, password, stored)
+
+
+class TTLCache(object):
+    # A cache shared by the requests and threads of a process. Entries
+    # expire after ``ttl`` seconds, and at most ``size`` are kept,
+    # forgetting the least recently used first. ``clear`` bumps
+    # ``generation``: pass the generation from before you read the value
+    # to ``set``, and a value read before a clear is not stored after it.
+
+    def __init__(self, size=1000, ttl=300):
+        self.size = size
+        self.ttl = ttl
+        self.generation = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return default
+            self.entries[key] = entry
+            return entry[1]
+
+    def set(self, key, value, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + self.ttl, value)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+# The groups of recently seen users, so that checking permissions doesn't
+# look them up again and again.
+principal_cache = TTLCache()
+_missing = object()
+
 
 def groupfinder(userid, request):
+    groups = principal_cache.get(userid, _missing)
+    if groups is _missing:
+        groups = find_groups(userid)
+        principal_cache.set(userid, groups)
+    return groups
+
+
+def find_groups(userid):
     if userid in USERS:
-        return GROUPS.get(userid, [])
\ No newline at end of file
+        return GROUPS.get(userid, [])
+
+
+def forget_user(userid):
+    # Call this after changing a user in USERS or GROUPS.
+    principal_cache.discard(userid)
+
+
+# Decisions on permissions, by the path of the node, the principals, and
+# the permission: see CachingACLAuthorizationPolicy. The models clear it
+# when an ACL changes, or a node is moved or deleted. The ttl bounds how
+# long changes made by other processes go unseen.
+acl_cache = TTLCache(size=10000, ttl=60)
+
+
+def match_acl(acl, principals, permission):
+    # The first entry of ``acl`` giving or denying one of ``principals``
+    # ``permission``, as ACLAuthorizationPolicy finds it, or None.
+    for ace in acl:
+        action, principal, permissions = ace
+        if principal in principals:
+            if not is_nonstr_iter(permissions):
+                permissions = [permissions]
+            if permission in permissions:
+                return ace
+    return None
+
+
+class CachingACLAuthorizationPolicy(ACLAuthorizationPolicy):
+    # Decides as ACLAuthorizationPolicy does, but remembers each decision
+    # in acl_cache. A node whose own ACL doesn't decide takes the decision
+    # of its parent, which the parent's other children share, so once
+    # that is known, checking them neither loads the parent nor looks at
+    # its ACL again.
+
+    def permits(self, context, principals, permission):
+        if getattr(context, 'path', None) is None:
+            # not one of our nodes
+            return ACLAuthorizationPolicy.permits(
+                self, context, principals, permission)
+        principals = frozenset(principals)
+        # a decision made from ACLs read since then may be out of date
+        # already if the cache was cleared meanwhile: see TTLCache
+        generation = getattr(context, 'acl_generation', None)
+        if generation is None:
+            generation = acl_cache.generation
+        allowed, ace, acl = self.decide(context, principals, permission,
+                                        generation)
+        result = ACLAllowed if allowed else ACLDenied
+        return result(ace, acl, permission, principals, context)
+
+    def decide(self, node, principals, permission, generation):
+        # Plain values only, as the cache outlives the node.
+        key = (node.path, principals, permission)
+        decision = acl_cache.get(key)
+        if decision is None:
+            acl = list(getattr(node, '__acl__', ()))
+            ace = match_acl(acl, principals, permission)
+            if ace is not None:
+                decision = (ace[0] == Allow, ace, acl)
+            elif node.__parent__ is not None:
+                decision = self.decide(node.__parent__, principals,
+                                       permission, generation)
+            else:
+                decision = (False, '<default deny>',
+                            '<No ACL found on any object in resource '
+                            'lineage>')
+            acl_cache.set(key, decision, generation)
+        return decision
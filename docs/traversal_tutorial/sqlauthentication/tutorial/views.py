@@ -1,20 +1,27 @@
 from random import randint
 
+from pyramid.decorator import reify
 from pyramid.httpexceptions import HTTPFound
 from pyramid.location import lineage
 from pyramid.security import (
     remember,
     forget,
-    authenticated_userid
     )
 from pyramid.view import view_config
 
 from .models import (
     Root,
     Folder,
-    Document
+    Document,
+    permitted
     )
-from .security import USERS
+from .security import (
+    check_password,
+    forget_user
+    )
+
+
+PAGE_SIZE = 50
 
 
 class TutorialViews(object):
@@ -22,22 +29,44 @@ class TutorialViews(object):
         self.context = context
         self.request = request
         self.parents = reversed(list(lineage(context)))
-        self.logged_in = authenticated_userid(request)
+
+    @reify
+    def logged_in(self):
+        # only looked up for the views and templates that use it
+        return self.request.authenticated_userid
+
+    @reify
+    def contents(self):
+        # A page of the context's children that we may view, and the name
+        # to pass as ``after`` for the next page, if there is one. The
+        # database leaves out the others, deciding for the children that
+        # have no ACL of their own as for the context.
+        request = self.request
+        allowed = permitted(request.effective_principals, 'view',
+                            request.has_permission('view', self.context))
+        children = list(self.context.values(
+            after=request.params.get('after'), limit=PAGE_SIZE + 1,
+            allowed=allowed))
+        if len(children) > PAGE_SIZE:
+            return children[:PAGE_SIZE], children[PAGE_SIZE - 1].__name__
+        return children, None
 
     @view_config(renderer="templates/root.jinja2",
-                 context=Root)
+                 context=Root, permission='view')
     def root(self):
         page_title = 'Quick Tutorial: Root'
         return dict(page_title=page_title)
 
     @view_config(renderer="templates/folder.jinja2",
-                 context=Folder)
+                 context=Folder, permission='view')
     def folder(self):
         page_title = 'Quick Tutorial: Folder'
         return dict(page_title=page_title)
 
-    @view_config(name="add_folder", context=Root)
-    @view_config(name="add_folder", context=Folder)
+    @view_config(name="add_folder", context=Root,
+                 permission='edit')
+    @view_config(name="add_folder", context=Folder,
+                 permission='edit')
     def add_folder(self):
         # Make a new Folder
         title = self.request.POST['folder_title']
@@ -49,8 +78,10 @@ class TutorialViews(object):
         url = self.request.resource_url(new_folder)
         return HTTPFound(location=url)
 
-    @view_config(name="add_document", context=Root)
-    @view_config(name="add_document", context=Folder)
+    @view_config(name="add_document", context=Root,
+                 permission='edit')
+    @view_config(name="add_document", context=Folder,
+                 permission='edit')
     def add_document(self):
         # Make a new Document
         title = self.request.POST['document_title']
@@ -63,7 +94,7 @@ class TutorialViews(object):
         return HTTPFound(location=url)
 
     @view_config(renderer="templates/document.jinja2",
-                 context=Document)
+                 context=Document, permission='view')
     def document(self):
         page_title = 'Quick Tutorial: Document'
         return dict(page_title=page_title)
@@ -78,7 +109,7 @@ class TutorialViews(object):
         if 'form.submitted' in request.params:
             login = request.params['login']
             password = request.params['password']
-            if USERS.get(login) == password:
+            if check_password(login, password):
                 headers = remember(request, login)
                 return HTTPFound(location='/',
                                  headers=headers)
@@ -95,6 +126,7 @@ class TutorialViews(object):
     @view_config(name='logout')
     def logout(self):
         request = self.request
+        forget_user(self.logged_in)
         headers = forget(request)
         url = request.resource_url(request.root)
         return HTTPFound(location=url,
@@ -1,16 +1,43 @@
+import random
+import time
+
 from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid_retry import IBeforeRetry
 from pyramid_zodbconn import get_connection
 
 from .resources import bootstrap
 
 
 def root_factory(request):
+    # the connection keeps the objects it has loaded, so after its first
+    # request this costs no database access at all
     conn = get_connection(request)
-    return bootstrap(conn.root())
+    return conn.get(request.registry.root_oid)
+
+def back_off(event):
+    # Wait before retrying a request that had a ConflictError, longer
+    # after each attempt, and at random, so the requests that conflicted
+    # are unlikely to conflict again.
+    attempt = event.environ['retry.attempt']
+    time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
 
 def main(global_config, **settings):
     config = Configurator(settings=settings,
                           root_factory=root_factory)
     config.include('pyramid_jinja2')
+    config.add_subscriber(back_off, IBeforeRetry)
     config.scan('.views')
-    return config.make_wsgi_app()
+    app = config.make_wsgi_app()
+
+    # Create the root once, at startup, rather than on every request
+    request = Request.blank('/')
+    request.registry = config.registry
+    conn = get_connection(request)
+    try:
+        root = bootstrap(conn.root())
+        config.registry.root_oid = root._p_oid
+    finally:
+        conn.transaction_manager.abort()
+        conn.close()
+    return app
@@ -0,0 +1,208 @@
+from calendar import timegm
+import random
+
+from BTrees.IIBTree import IITreeSet, intersection, multiunion
+from BTrees.IOBTree import IOBTree
+from BTrees.LOBTree import LOBTree
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
+from persistent import Persistent
+
+
+class Catalog(Persistent):
+    # Finds content by the values of its attributes without loading the
+    # content itself. Each index maps values to sets of integer ids, and
+    # ``objects`` maps ids back to the content, which is only loaded when
+    # a ResultSet is iterated over.
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.objects = IOBTree()
+        self.length = Length()
+
+    def __len__(self):
+        return self.length()
+
+    def index(self, obj):
+        # Add obj, or update its entries if it's already in the catalog.
+        docid = getattr(obj, 'docid', None)
+        if docid is None:
+            docid = obj.docid = self.new_docid()
+        if docid not in self.objects:
+            self.objects[docid] = obj
+            self.length.change(1)
+        for index in self.indexes.values():
+            index.index(docid, obj)
+        return docid
+
+    def unindex(self, obj):
+        docid = obj.docid
+        for index in self.indexes.values():
+            index.unindex(docid)
+        del self.objects[docid]
+        self.length.change(-1)
+        del obj.docid
+
+    def new_docid(self):
+        # Random ids, rather than counting up, spread the content added
+        # at the same time over different buckets of the BTrees, so it
+        # rarely conflicts.
+        while True:
+            docid = random.randint(-2 ** 31, 2 ** 31 - 1)
+            if docid not in self.objects:
+                return docid
+
+    def query(self, **terms):
+        # The content matching all the terms, each given as an index name
+        # and a value for that index.
+        docids = None
+        for name, value in sorted(terms.items()):
+            found = self.indexes[name].apply(value)
+            if docids is None:
+                docids = found
+            else:
+                docids = intersection(docids, found)
+        if docids is None:
+            docids = IITreeSet(self.objects.keys())
+        return ResultSet(self, docids)
+
+
+class ResultSet(object):
+    # The ids of the content a query found. Iterating over it loads the
+    # content one object at a time.
+    def __init__(self, catalog, docids):
+        self.catalog = catalog
+        self.docids = docids
+
+    def __len__(self):
+        return len(self.docids)
+
+    def __iter__(self):
+        objects = self.catalog.objects
+        for docid in self.docids:
+            yield objects[docid]
+
+    def sort(self, index_name, reverse=False, limit=None):
+        index = self.catalog.indexes[index_name]
+        docids = index.sort(self.docids, reverse=reverse, limit=limit)
+        return ResultSet(self.catalog, list(docids))
+
+
+class Index(Persistent):
+    # ``forward`` maps each value to the set of ids of the objects having
+    # it, ``reverse`` maps the ids back to what was indexed for each.
+    def __init__(self, attribute):
+        self.attribute = attribute
+        self.forward = OOBTree()
+        self.reverse = IOBTree()
+
+    def add(self, key, docid):
+        docids = self.forward.get(key)
+        if docids is None:
+            docids = self.forward[key] = IITreeSet()
+        docids.insert(docid)
+
+    def remove(self, key, docid):
+        docids = self.forward[key]
+        docids.remove(docid)
+        if not docids:
+            del self.forward[key]
+
+
+class FieldIndex(Index):
+    # Indexes one value of each object, such as its title. Query it with
+    # a value, or with a (min, max) tuple for a range of values, where
+    # None leaves that end open.
+    def key(self, value):
+        return value
+
+    def index(self, docid, obj):
+        value = getattr(obj, self.attribute, None)
+        key = None if value is None else self.key(value)
+        old = self.reverse.get(docid)
+        if key == old:
+            return
+        if old is not None:
+            self.remove(old, docid)
+            del self.reverse[docid]
+        if key is not None:
+            self.add(key, docid)
+            self.reverse[docid] = key
+
+    def unindex(self, docid):
+        old = self.reverse.pop(docid, None)
+        if old is not None:
+            self.remove(old, docid)
+
+    def apply(self, value):
+        if isinstance(value, tuple):
+            low, high = [None if v is None else self.key(v) for v in value]
+            return multiunion(list(self.forward.values(low, high)))
+        return self.forward.get(self.key(value), IITreeSet())
+
+    def sort(self, docids, reverse=False, limit=None):
+        # Objects this index has no value for are left out.
+        if limit is None or len(docids) <= limit * 10:
+            # few enough to look up the value of each
+            keyed = [(self.reverse[docid], docid) for docid in docids
+                     if docid in self.reverse]
+            keyed.sort(reverse=reverse)
+            return [docid for key, docid in keyed[:limit]]
+        # otherwise walk the index in order, and stop at the limit
+        keys = self.forward.keys()
+        if reverse:
+            keys = reversed(keys)
+        found = []
+        for key in keys:
+            for docid in self.forward[key]:
+                if docid in docids:
+                    found.append(docid)
+                    if len(found) == limit:
+                        return found
+        return found
+
+
+class DateIndex(FieldIndex):
+    # A FieldIndex of UTC datetimes, stored as microseconds since 1970,
+    # which keeps its keys plain 64 bit integers.
+    def __init__(self, attribute):
+        FieldIndex.__init__(self, attribute)
+        self.forward = LOBTree()
+
+    def key(self, value):
+        return timegm(value.utctimetuple()) * 1000000 + value.microsecond
+
+
+class KeywordIndex(Index):
+    # Indexes a collection of values of each object, such as the words of
+    # its title. Query it with a value, for the objects having it, or with
+    # a list of values, for the objects having any of them.
+    def index(self, docid, obj):
+        new = set(getattr(obj, self.attribute, None) or ())
+        old = set(self.reverse.get(docid, ()))
+        for key in old - new:
+            self.remove(key, docid)
+        for key in new - old:
+            self.add(key, docid)
+        if new:
+            self.reverse[docid] = tuple(sorted(new))
+        elif old:
+            del self.reverse[docid]
+
+    def unindex(self, docid):
+        for key in self.reverse.pop(docid, ()):
+            self.remove(key, docid)
+
+    def apply(self, value):
+        if isinstance(value, list):
+            return multiunion([self.forward.get(v, IITreeSet())
+                               for v in value])
+        return self.forward.get(value, IITreeSet())
+
+
+def make_catalog():
+    return Catalog({
+        'content_type': FieldIndex('content_type'),
+        'title': FieldIndex('title'),
+        'keywords': KeywordIndex('keywords'),
+        'created': DateIndex('created'),
+    })
@@ -1,23 +1,84 @@
+from datetime import datetime
+
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
 from persistent import Persistent
-from persistent.mapping import PersistentMapping
 import transaction
 
+from .catalog import make_catalog
+
+
+class Content(Persistent):
+    # What the catalog indexes: see make_catalog
+    content_type = None
 
-class Folder(PersistentMapping):
     def __init__(self, title):
-        PersistentMapping.__init__(self)
+        Persistent.__init__(self)
         self.title = title
+        self.created = datetime.utcnow()
+
+    @property
+    def keywords(self):
+        return set(self.title.lower().split())
+
+
+class Folder(Content):
+    # The children live in a BTree, not in the folder's own record, so
+    # adding one only rewrites a bucket of the tree, and the BTree and
+    # Length resolve the conflicts of concurrent adds to different names.
+    content_type = 'folder'
+
+    def __init__(self, title):
+        Content.__init__(self, title)
+        self.data = OOBTree()
+        self.length = Length()
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def __setitem__(self, name, value):
+        if name not in self.data:
+            self.length.change(1)
+        self.data[name] = value
+
+    def __delitem__(self, name):
+        del self.data[name]
+        self.length.change(-1)
+
+    def __contains__(self, name):
+        return name in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return self.length()
+
+    def get(self, name, default=None):
+        return self.data.get(name, default)
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
 
 
 class Root(Folder):
     __name__ = None
     __parent__ = None
+    content_type = 'root'
 
-
-class Document(Persistent):
     def __init__(self, title):
-        Persistent.__init__(self)
-        self.title = title
+        Folder.__init__(self, title)
+        self.catalog = make_catalog()
+
+
+class Document(Content):
+    content_type = 'document'
 
 
 def bootstrap(zodb_root):
@@ -21,7 +21,10 @@ class TutorialViews(object):
                  context=Root)
     def root(self):
         page_title = 'Quick Tutorial: Root'
-        return dict(page_title=page_title)
+        # found by the catalog, without walking the folders
+        recent = self.context.catalog.query(
+            content_type='document').sort('created', reverse=True, limit=5)
+        return dict(page_title=page_title, recent=recent)
 
     @view_config(renderer='templates/folder.jinja2',
                  context=Folder)
@@ -38,6 +41,7 @@ class TutorialViews(object):
         new_folder.__name__ = name
         new_folder.__parent__ = self.context
         self.context[name] = new_folder
+        self.request.root.catalog.index(new_folder)
 
         # Redirect to the new folder
         url = self.request.resource_url(new_folder)
@@ -52,6 +56,7 @@ class TutorialViews(object):
         new_document.__name__ = name
         new_document.__parent__ = self.context
         self.context[name] = new_document
+        self.request.root.catalog.index(new_document)
 
         # Redirect to the new document
         url = self.request.resource_url(new_document)